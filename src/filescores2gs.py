@@ -3,7 +3,6 @@
 This script contains the ClasswiseMetrics class. Objects of this class can be used to compute
 the mean intersection-over-union scores on a per-prediction basis for each test class.
 """
-import torch
 
 class Metrics:
     """ Metrics for a single class
@@ -21,6 +20,8 @@ class Metrics:
         -------
         update(output, label)
             updates the sum of intersection and union values
+        update_counts(intersection, union)
+            updates the sums with precomputed pixel counts
         iou()
             compute the overall intersection over union
     """
@@ -60,10 +61,27 @@ class Metrics:
 
         """
         i, u = self._i_and_u(output, label)
-        assert((i >= 0) and (u >= 0))
-        self.intersection += i
-        self.union += u
-        return float(i) / (u + self.eps)
+        return self.update_counts(i, u)
+
+    def update_counts(self, intersection, union):
+        """ update intersection and union records with precomputed pixel counts.
+
+        Parameters:
+        ------------
+        intersection : int
+            the number of pixels set in both the prediction and the groundtruth
+        union : int
+            the number of pixels set in either the prediction or the groundtruth
+
+        Return Value:
+        -------------
+            the intersection over union for the prediction
+
+        """
+        assert((intersection >= 0) and (union >= 0))
+        self.intersection += intersection
+        self.union += union
+        return float(intersection) / (union + self.eps)
 
     def iou(self):
         """ get the overall intersection-over-union values
@@ -91,6 +109,8 @@ class ClasswiseMetrics:
         -------
         update(class_index, output, label)
             updates the metrics with the prediction for a particular class
+        update_counts(class_index, intersection, union)
+            updates the metrics for a particular class with precomputed pixel counts
         meanIoU()
             compute the mean intersection over union over the clases.
     """
@@ -118,6 +138,26 @@ class ClasswiseMetrics:
             self.ms[class_index] = Metrics()
         return self.ms[class_index].update(output, label)
 
+    def update_counts(self, class_index, intersection, union):
+        """ updates the metrics for a particular class with precomputed pixel counts
+        Parameters:
+        ------------
+        class_index : int
+            the index of the class for which this entry is to be stored
+        intersection : int
+            the number of pixels set in both the prediction and the groundtruth
+        union : int
+            the number of pixels set in either the prediction or the groundtruth
+
+        Return Value:
+        -------------
+            the intersection over union for the prediction
+
+        """
+        if not(class_index in self.ms):
+            self.ms[class_index] = Metrics()
+        return self.ms[class_index].update_counts(intersection, union)
+
     def meanIoU(self):
         """ compute the mean intersection over union over all of the classes
         Return Value:
@@ -131,6 +171,8 @@ class ClasswiseMetrics:
 
 
 if __name__ == "__main__":
+    import torch
+
     cm = ClasswiseMetrics()
     def rand_mask(w, h):
         x = torch.randn((w, h))
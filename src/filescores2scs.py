@@ -41,7 +41,6 @@ Example Usage:
 ```
 """
 from functools import reduce
-import torch
 
 class Metrics:
     """ Metrics for a single class
@@ -59,6 +58,8 @@ class Metrics:
         -------
         update(output, label)
             updates the sum of intersection and union values
+        update_counts(intersection, union)
+            updates the sums with precomputed pixel counts
         iou()
             compute the overall intersection over union
     """
@@ -98,10 +99,27 @@ class Metrics:
 
         """
         i, u = self._i_and_u(output, label)
-        assert((i >= 0) and (u >= 0))
-        self.intersection += i
-        self.union += u
-        return float(i) / (u + self.eps)
+        return self.update_counts(i, u)
+
+    def update_counts(self, intersection, union):
+        """ update intersection and union records with precomputed pixel counts.
+
+        Parameters:
+        ------------
+        intersection : int
+            the number of pixels set in both the prediction and the groundtruth
+        union : int
+            the number of pixels set in either the prediction or the groundtruth
+
+        Return Value:
+        -------------
+            the intersection over union for the prediction
+
+        """
+        assert((intersection >= 0) and (union >= 0))
+        self.intersection += intersection
+        self.union += union
+        return float(intersection) / (union + self.eps)
 
     def iou(self):
         """ get the overall intersection-over-union values
@@ -129,6 +147,8 @@ class SCSScore:
         -------
         update(classidx, case_weight, output, label)
             updates the metrics with the prediction for a particular class
+        update_counts(classidx, case_weight, intersection, union)
+            updates the metrics for a particular class with precomputed pixel counts
         meanIoU()
             compute the mean intersection over union over the clases.
     """
@@ -167,6 +187,26 @@ class SCSScore:
 
         """
         return self.ms[class_index][case_weight_idx].update( output, label )
+
+    def update_counts(self, class_index, case_weight_idx, intersection, union):
+        """ updates the metrics for a particular class with precomputed pixel counts
+        Parameters:
+        ------------
+        class_index : int
+            the index of the class for which this entry is to be stored
+        case_weight_idx: int (10, 5, 1, or -1)
+            the weight to use for the specified test-case.
+        intersection : int
+            the number of pixels set in both the prediction and the groundtruth
+        union : int
+            the number of pixels set in either the prediction or the groundtruth
+
+        Return Value:
+        -------------
+            the intersection over union for the prediction
+
+        """
+        return self.ms[class_index][case_weight_idx].update_counts(intersection, union)
         
 
     def meanIoU(self):
@@ -191,6 +231,8 @@ class SCSScore:
 
 
 if __name__ == "__main__":
+    import torch
+
     scs = SCSScore(class_list=[0,1,2,3,4])
     def rand_mask(w, h):
         x = torch.randn((w, h))
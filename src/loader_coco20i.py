@@ -0,0 +1,195 @@
+""" loader_coco20i - loader for the COCO-20i fixed test splits
+
+The files in data/fixedsplits/coco20i/splitN_test.txt list (query, support) pairs such as
+```
+	1_129492 1_156076
+```
+The first token is the 1-based COCO-20i class index (the position of the category in the sorted
+list of COCO category ids), the second is the COCO image id.
+
+Rather than pre-rendering a binary mask for every (class, image) combination, the instance
+annotation file (e.g. instances_val2014.json) is read once into an index keyed on (class, image),
+and the binary mask for a pair is rasterized on demand, directly at the target resolution.
+Rasterized masks are kept in a bounded LRU cache.
+"""
+import torch
+from torch.utils.data import Dataset
+import numpy as np
+import os
+import json
+from collections import OrderedDict
+import cv2
+
+from loader_tier2 import resizer, normalizer, tensorify, mask_tensorify, compose, read_rgb, pair_iterator
+
+
+############################################################## Mask Rasterization #####################################################
+def rle_decode(counts, height, width):
+	""" decode an uncompressed (list of run-lengths) COCO RLE into a hxw uint8 mask """
+	counts = np.asarray(counts, dtype=np.int64)
+	values = np.arange(len(counts)) % 2
+	flat = np.repeat(values, counts).astype(np.uint8)
+	# COCO RLE is column-major
+	return flat[:height * width].reshape((width, height)).T
+
+
+def rasterize(segmentations, height, width, image_size):
+	""" rasterize the segmentations of one class in one image into an image_size x image_size mask
+
+	Polygons are scaled and filled directly at the target resolution. RLE segmentations are decoded
+	at the native resolution and resized with nearest-neighbour interpolation.
+	"""
+	mask = np.zeros((image_size, image_size), dtype=np.uint8)
+	scale = np.array([image_size / float(width), image_size / float(height)])
+	polygons = []
+	for seg in segmentations:
+		if isinstance(seg, list):
+			for poly in seg:
+				pts = np.asarray(poly, dtype=np.float64).reshape(-1, 2) * scale
+				polygons.append(np.round(pts).astype(np.int32))
+			continue
+		if isinstance(seg["counts"], list):
+			full = rle_decode(seg["counts"], height, width)
+		else:
+			# compressed RLE strings need the reference decoder
+			from pycocotools import mask as cocomask
+			full = cocomask.decode(seg)
+		full = cv2.resize(full, dsize=(image_size, image_size), interpolation=cv2.INTER_NEAREST)
+		mask[full > 0] = 1
+	if polygons:
+		cv2.fillPoly(mask, polygons, 1)
+	return mask
+
+
+class MaskCache:
+	""" bounded least-recently-used cache for rasterized masks """
+	def __init__(self, maxsize):
+		self.maxsize = maxsize
+		self.entries = OrderedDict()
+
+	def get(self, key, make):
+		if key in self.entries:
+			self.entries.move_to_end(key)
+			return self.entries[key]
+		value = make()
+		if self.maxsize > 0:
+			self.entries[key] = value
+			if len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+		return value
+
+	def __len__(self):
+		return len(self.entries)
+
+
+############################################################## Annotation Index #######################################################
+def parse_item(item):
+	classidx, image_id = item.strip().split("_")
+	return int(classidx), int(image_id)
+
+
+class COCOAnnotationIndex:
+	""" (class, image) -> segmentations index built from a single pass over a COCO annotation file
+
+	Only the (class, image) keys in `needed` are retained, so the index holds the annotations for
+	the split file at hand and not the whole of COCO.
+	"""
+	def __init__(self, annfile, needed=None):
+		with open(annfile, "r") as f:
+			coco = json.load(f)
+
+		# COCO-20i class indices are 1-based positions in the sorted category id list
+		self.catids = sorted(cat["id"] for cat in coco["categories"])
+		cat2class = {catid: i + 1 for i, catid in enumerate(self.catids)}
+		needed_images = None if needed is None else set(image_id for _, image_id in needed)
+
+		self.images = {}
+		for image in coco["images"]:
+			if needed_images is None or image["id"] in needed_images:
+				self.images[image["id"]] = (image["file_name"], image["height"], image["width"])
+
+		self.segmentations = {}
+		for ann in coco["annotations"]:
+			key = (cat2class[ann["category_id"]], ann["image_id"])
+			if needed is not None and key not in needed:
+				continue
+			self.segmentations.setdefault(key, []).append(ann["segmentation"])
+
+	def image_info(self, image_id):
+		return self.images[image_id]
+
+	def segments(self, classidx, image_id):
+		return self.segmentations.get((classidx, image_id), [])
+
+
+class COCOPairIndex:
+	def __init__(self, imagedir, annfile, listfile):
+		self.imagedir = imagedir
+		self.files = np.genfromtxt(listfile, dtype=str)
+		self.pairs = [(parse_item(q), parse_item(s)) for q, s in self.files]
+		needed = set(item for pair in self.pairs for item in pair)
+		self.annotations = COCOAnnotationIndex(annfile, needed=needed)
+
+	def __getitem__(self, index):
+		(qclass, qid), (sclass, sid) = self.pairs[index]
+		return (qclass, qid), (sclass, sid), qclass
+
+	def image_path(self, image_id):
+		return os.path.join(self.imagedir, self.annotations.image_info(image_id)[0])
+
+	def __len__(self):
+		return len(self.pairs)
+
+
+class COCOPairLoader(Dataset):
+	def __init__(self, imagedir, annfile, pairlistfile, image_size, cache_size=4096):
+		self.image_size = image_size
+		self.imageTransform = compose(
+			resizer(image_size),
+			normalizer(np.array([.485, .456, .406]), np.array([.229, .224, .225])),
+			tensorify)
+		self.fsindex = COCOPairIndex(imagedir=imagedir, annfile=annfile, listfile=pairlistfile)
+		self.maskcache = MaskCache(cache_size)
+
+	def _mask(self, classidx, image_id):
+		def _make():
+			_, height, width = self.fsindex.annotations.image_info(image_id)
+			segs = self.fsindex.annotations.segments(classidx, image_id)
+			return rasterize(segs, height, width, self.image_size)
+		# copy so that mask_tensorify does not modify the cached entry
+		return self.maskcache.get((classidx, image_id), _make).copy()
+
+	def __getitem__(self, index):
+		(qclass, qid), (sclass, sid), classidx = self.fsindex[index]
+
+		qimage = torch.from_numpy(self.imageTransform(read_rgb(self.fsindex.image_path(qid)))).float()
+		qmask = torch.from_numpy(mask_tensorify(self._mask(qclass, qid))).float()
+		simage = torch.from_numpy(self.imageTransform(read_rgb(self.fsindex.image_path(sid)))).float()
+		smask = torch.from_numpy(mask_tensorify(self._mask(sclass, sid))).float()
+
+		return simage, smask, qimage, qmask, classidx
+
+	def __len__(self):
+		return len(self.fsindex)
+
+
+def coco_pair_iterator(imagedir, annfile, image_size, listname, num_workers, batch_size, cache_size=4096):
+	return pair_iterator(
+		loader=COCOPairLoader(
+			imagedir=imagedir,
+			annfile=annfile,
+			pairlistfile=listname,
+			image_size=image_size,
+			cache_size=cache_size),
+		num_workers=num_workers,
+		batch_size=batch_size,
+		shuffle=False
+	)
+
+
+if __name__ == "__main__":
+	iterator = coco_pair_iterator(
+		"data/coco/val2014", "data/coco/annotations/instances_val2014.json", 256,
+		"data/fixedsplits/coco20i/split0_test.txt", 1, 4)
+	for (simg, smask, qimg, qmask, cidx) in iterator:
+		print(simg.shape, smask.shape, qimg.shape, qmask.shape, cidx)
@@ -0,0 +1,191 @@
+""" loader_fss1000 - loader for the generalization tier of TOSS
+
+The generalization tier (data/tiers/general/general_tier.txt) lists FSS-1000 (query, support) pairs:
+```
+	642_sundial_9 642_sundial_4
+```
+The leading number is ignored; the class is looked up by name in
+data/tiers/generalization_tier_class.txt. File names follow the layout produced by
+organizefss1000.py, i.e. data/fss1k/images/sundial_9.jpg and data/fss1k/masks/sundial_9.png.
+
+All paths and class ids are resolved once when the index is built. The tier only references about
+a thousand 224x224 images (~160MB as uint8), so the loader can preload every image and mask into a
+single contiguous uint8 tensor and serve all pairs without touching the disk.
+
+The loader can also read from shards packed with `shards.py --fss1000`, which are keyed on
+images/<stem>.jpg and masks/<stem>.png.
+"""
+import torch
+from torch.utils.data import Dataset
+import numpy as np
+import os
+import re
+
+from loader_tier2 import resizer, mask_resizer, normalizer, tensorify, mask_tensorify, compose, read_rgb, read_mask, decode_rgb, decode_mask, pair_iterator
+from shards import ShardStore
+
+
+def classkey(name):
+	""" letters-only key; the class list and the renamed files differ in punctuation and digits """
+	return re.sub("[^a-z]", "", name.lower())
+
+
+def class_resolver(classes):
+	""" map a class name taken from a file name to its row in the class list
+
+	A few entries in the class list are truncated (e.g. hen_of for hen_of_the_woods), so names
+	without an exact match resolve to the longest class key that is a prefix of theirs.
+	"""
+	keys = {classkey(c): i for i, c in enumerate(classes)}
+	resolved = {}
+
+	def _resolve(name):
+		if name not in resolved:
+			k = classkey(name)
+			if k not in keys:
+				prefixes = [ck for ck in keys if k.startswith(ck)]
+				if not prefixes:
+					raise KeyError(f"class {name} is not in the class list")
+				k = max(prefixes, key=len)
+			resolved[name] = keys[k]
+		return resolved[name]
+
+	return _resolve
+
+
+class FSS1000PairIndex:
+	""" resolves every pair of the generalization tier in a single pass
+
+		Attributes
+		-----------
+		names : [str]
+			the unique file stems (e.g. sundial_9) referenced by the pair list
+		imagepaths, maskpaths : [str]
+			image and mask path for each entry of names
+		classids : ndarray[int64]
+			class id (row in the class list) for each entry of names
+		pairs : ndarray[n, 2]
+			(query, support) indices into names for each pair
+	"""
+	def __init__(self, imagedir, maskdir, listfile, classfile):
+		self.imagedir = imagedir
+		self.maskdir = maskdir
+		with open(classfile, "r") as f:
+			self.classes = [line.strip() for line in f if line.strip()]
+		resolve = class_resolver(self.classes)
+
+		self.names = []
+		self.imagepaths = []
+		self.maskpaths = []
+		classids = []
+		slots = {}
+		pairs = []
+		with open(listfile, "r") as f:
+			for line in f:
+				if not line.strip():
+					continue
+				pair = []
+				for item in line.split()[:2]:
+					if item not in slots:
+						# drop the (ignored) leading class number
+						stem = item.split("_", 1)[1]
+						slots[item] = len(self.names)
+						self.names.append(stem)
+						self.imagepaths.append(os.path.join(imagedir, stem + ".jpg"))
+						self.maskpaths.append(os.path.join(maskdir, stem + ".png"))
+						classids.append(resolve(stem.rsplit("_", 1)[0]))
+					pair.append(slots[item])
+				pairs.append(pair)
+		self.classids = np.array(classids, dtype=np.int64)
+		self.pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+	def __getitem__(self, index):
+		q, s = self.pairs[index]
+		return self.imagepaths[q], self.maskpaths[q], self.imagepaths[s], self.maskpaths[s], int(self.classids[q])
+
+	def __len__(self):
+		return len(self.pairs)
+
+
+class FSS1000PairLoader(Dataset):
+	def __init__(self, imagedir, maskdir, pairlistfile, classfile, image_size, preload=False, sharddir=None):
+		self.resize = resizer(image_size)
+		self.maskResize = mask_resizer(image_size)
+		self.imageTransform = compose(
+			normalizer(np.array([.485, .456, .406]), np.array([.229, .224, .225])),
+			tensorify)
+		self.store = None
+		if sharddir is not None:
+			# the shard index is keyed on paths relative to the dataset root
+			imagedir, maskdir = "images", "masks"
+			self.store = ShardStore(sharddir)
+		self.fsindex = FSS1000PairIndex(imagedir=imagedir, maskdir=maskdir, listfile=pairlistfile, classfile=classfile)
+		self.images = None
+		self.masks = None
+		if preload:
+			self._preload(image_size)
+
+	def _read(self, slot):
+		""" the image and mask of an entry of fsindex.names, at their stored size """
+		if self.store is not None:
+			image = decode_rgb(self.store.read(self.fsindex.imagepaths[slot]))
+			mask = decode_mask(self.store.read(self.fsindex.maskpaths[slot]))
+			return image, mask
+		return read_rgb(self.fsindex.imagepaths[slot]), read_mask(self.fsindex.maskpaths[slot])
+
+	def _preload(self, image_size):
+		""" read every referenced image and mask once into contiguous uint8 tensors """
+		n = len(self.fsindex.names)
+		images = np.empty((n, image_size, image_size, 3), dtype=np.uint8)
+		masks = np.empty((n, image_size, image_size), dtype=np.uint8)
+		for i in range(n):
+			image, mask = self._read(i)
+			images[i] = self.resize(image)
+			masks[i] = self.maskResize(mask)
+		self.images = torch.from_numpy(images)
+		self.masks = torch.from_numpy(masks)
+
+	def _item(self, slot):
+		if self.images is not None:
+			image = self.images[slot].numpy()
+			mask = self.masks[slot].numpy().copy()
+		else:
+			image, mask = self._read(slot)
+			image = self.resize(image)
+			mask = self.maskResize(mask)
+		image = torch.from_numpy(self.imageTransform(image)).float()
+		mask = torch.from_numpy(mask_tensorify(mask)).float()
+		return image, mask
+
+	def __getitem__(self, index):
+		q, s = self.fsindex.pairs[index]
+		qimage, qmask = self._item(q)
+		simage, smask = self._item(s)
+		return simage, smask, qimage, qmask, int(self.fsindex.classids[q])
+
+	def __len__(self):
+		return len(self.fsindex)
+
+
+def general_pair_iterator(imagedir, maskdir, image_size, listname, classfile, num_workers, batch_size, preload=True, sharddir=None):
+	return pair_iterator(
+		loader=FSS1000PairLoader(
+			imagedir=imagedir,
+			maskdir=maskdir,
+			pairlistfile=listname,
+			classfile=classfile,
+			image_size=image_size,
+			preload=preload,
+			sharddir=sharddir),
+		num_workers=num_workers,
+		batch_size=batch_size,
+		shuffle=False
+	)
+
+
+if __name__ == "__main__":
+	iterator = general_pair_iterator(
+		"data/fss1k/images", "data/fss1k/masks", 224,
+		"data/tiers/general/general_tier.txt", "data/tiers/generalization_tier_class.txt", 1, 4)
+	for (simg, smask, qimg, qmask, cidx) in iterator:
+		print(simg.shape, smask.shape, qimg.shape, qmask.shape, cidx)
@@ -1,11 +1,16 @@
 import torch
 from torch.utils.data import Dataset
 from torch.utils.data import DataLoader
+from torch.utils.data import get_worker_info
 import numpy as np
 import os
+import io
 from PIL import Image
 import cv2
 
+from prefetch import AsyncPrefetcher, worker_order
+from shards import ShardStore
+
 ############################################################## Loader Utilities #######################################################
 def resizer(image_size):
 	def _resize(img):
@@ -61,6 +66,17 @@ def read_mask(path):
 		return np.array(Image.open(f).convert('L'))
 
 
+def decode_rgb(buf):
+	return np.array(Image.open(io.BytesIO(buf)).convert('RGB'))
+
+
+def decode_mask(buf):
+	# the aug/null masks have no file behind them, see read_mask
+	if buf is None:
+		return np.zeros((512, 512)).astype(np.uint8)
+	return np.array(Image.open(io.BytesIO(buf)).convert('L'))
+
+
 def declass(filename):
 	if filename.find("aug") != -1:
 		return "_".join( filename.split("_")[2:] )
@@ -71,9 +87,10 @@ def clsname(filename):
 	return filename.split("_")[0]
 
 class FSSPairIndex:
-	def __init__(self, imagedir, maskdir, listfile):
+	def __init__(self, imagedir, maskdir, listfile, mask_suffix="_gt.png"):
 		self.imagedir = imagedir
 		self.maskdir = maskdir
+		self.mask_suffix = mask_suffix
 		self.files = np.genfromtxt(listfile, dtype=str)
 
 	def __getitem__(self, index):
@@ -82,18 +99,22 @@ class FSSPairIndex:
 		else:
 			classidx = self.files[index][0].strip().split('_')[0]
 		queryimage = os.path.join(self.imagedir, declass(self.files[index][0]) + ".jpg")
-		querymask = os.path.join(self.maskdir, self.files[index][0] + "_gt.png")
+		querymask = os.path.join(self.maskdir, self.files[index][0] + self.mask_suffix)
 		supportimage = os.path.join(self.imagedir, declass(self.files[index][1]) + ".jpg")
-		supportmask = os.path.join(self.maskdir, self.files[index][1] + "_gt.png")
-		weight = float( self.files[index][2] )
-		scoretype = int( self.files[index][3] )
+		supportmask = os.path.join(self.maskdir, self.files[index][1] + self.mask_suffix)
+		# the attribute tier lists only (query, support)
+		if len(self.files[index]) > 2:
+			weight = float( self.files[index][2] )
+			scoretype = int( self.files[index][3] )
+		else:
+			weight, scoretype = 1., 1
 		return queryimage, querymask, supportimage, supportmask, int(classidx), weight, scoretype
 
 	def __len__(self):
 		return len(self.files)
 
 class FSSPairLoader(Dataset):
-	def __init__(self, imagedir, maskdir, pairlistfile, image_size):
+	def __init__(self, imagedir, maskdir, pairlistfile, image_size, mask_suffix="_gt.png"):
 		self.imageTransform = compose(
 			resizer(image_size),
 			normalizer(np.array([.485, .456, .406]), np.array([.229, .224, .225])),
@@ -102,7 +123,7 @@ class FSSPairLoader(Dataset):
 			mask_resizer(image_size),
 			mask_tensorify
 		)
-		self.fsindex = FSSPairIndex(imagedir=imagedir, maskdir=maskdir, listfile=pairlistfile)
+		self.fsindex = FSSPairIndex(imagedir=imagedir, maskdir=maskdir, listfile=pairlistfile, mask_suffix=mask_suffix)
 
 	def __getitem__(self, index):
 		# get item paths
@@ -120,16 +141,116 @@ class FSSPairLoader(Dataset):
 		return len(self.fsindex.files)
 
 
+class PrefetchedPairLoader(FSSPairLoader):
+	""" FSSPairLoader that reads the files of upcoming pairs ahead of time with an AsyncPrefetcher
+
+	Every DataLoader worker starts its own prefetcher on first use, reading ahead over the indices
+	it is going to be handed. This assumes an unshuffled iterator with the given batch_size; any
+	other access falls back to direct reads.
+	"""
+	def __init__(self, imagedir, maskdir, pairlistfile, image_size, batch_size=1, depth=32, concurrency=16, latency=0.0, mask_suffix="_gt.png"):
+		super().__init__(imagedir=imagedir, maskdir=maskdir, pairlistfile=pairlistfile, image_size=image_size, mask_suffix=mask_suffix)
+		self.batch_size = batch_size
+		self.depth = depth
+		self.concurrency = concurrency
+		self.latency = latency
+		self.prefetcher = None
+		self.pid = None
+
+	def __getstate__(self):
+		# the prefetcher's thread and event loop stay with the process that created them
+		state = self.__dict__.copy()
+		state["prefetcher"] = None
+		return state
+
+	def _prefetcher(self):
+		if self.prefetcher is None or self.pid != os.getpid():
+			info = get_worker_info()
+			worker_id, num_workers = (0, 1) if info is None else (info.id, info.num_workers)
+			self.prefetcher = AsyncPrefetcher(
+				paths_for=lambda index: self.fsindex[index][:4],
+				order=worker_order(len(self), self.batch_size, worker_id, num_workers),
+				depth=self.depth,
+				concurrency=self.concurrency,
+				latency=self.latency)
+			self.pid = os.getpid()
+		return self.prefetcher
+
+	def __getitem__(self, index):
+		_, _, _, _, classidx, weight, scoretype = self.fsindex[index]
+		qimage, qmask, simage, smask = self._prefetcher().get(index)
+
+		qimage = torch.from_numpy(self.imageTransform(decode_rgb(qimage))).float()
+		qmask = torch.from_numpy(self.maskTransform(decode_mask(qmask))).float()
+		simage = torch.from_numpy(self.imageTransform(decode_rgb(simage))).float()
+		smask = torch.from_numpy(self.maskTransform(decode_mask(smask))).float()
+
+		return simage, smask, qimage, qmask, classidx, weight, scoretype
+
+
+class ShardPairLoader(FSSPairLoader):
+	""" FSSPairLoader over the shard files written by shards.pack() """
+	def __init__(self, sharddir, pairlistfile, image_size, mask_suffix="_gt.png"):
+		# the shard index is keyed on paths relative to the dataset root
+		super().__init__(imagedir="images", maskdir="masks", pairlistfile=pairlistfile, image_size=image_size, mask_suffix=mask_suffix)
+		self.store = ShardStore(sharddir)
+
+	def _read(self, key):
+		# like read_mask, only the aug/null masks may be absent
+		if key.find("aug/null") != -1:
+			return None
+		return self.store.read(key)
+
+	def __getitem__(self, index):
+		qimage, qmask, simage, smask, classidx, weight, scoretype = self.fsindex[index]
+
+		qimage = torch.from_numpy(self.imageTransform(decode_rgb(self._read(qimage)))).float()
+		qmask = torch.from_numpy(self.maskTransform(decode_mask(self._read(qmask)))).float()
+		simage = torch.from_numpy(self.imageTransform(decode_rgb(self._read(simage)))).float()
+		smask = torch.from_numpy(self.maskTransform(decode_mask(self._read(smask)))).float()
+
+		return simage, smask, qimage, qmask, classidx, weight, scoretype
+
+
 def pair_iterator(loader, num_workers, batch_size, shuffle):
 	return DataLoader(loader, num_workers=num_workers, batch_size=batch_size, shuffle=shuffle)
 
-def fixed_pair_iterator(imagedir, maskdir, image_size, listname, num_workers, batch_size):
+def fixed_pair_iterator(imagedir, maskdir, image_size, listname, num_workers, batch_size, mask_suffix="_gt.png"):
 	return pair_iterator(
 		loader=FSSPairLoader(
 			imagedir=imagedir,
 			maskdir=maskdir,
 			pairlistfile=listname,
-			image_size=image_size),
+			image_size=image_size,
+			mask_suffix=mask_suffix),
+		num_workers=num_workers,
+		batch_size=batch_size,
+		shuffle=False
+	)
+
+def prefetched_pair_iterator(imagedir, maskdir, image_size, listname, num_workers, batch_size, depth=32, concurrency=16, mask_suffix="_gt.png"):
+	return pair_iterator(
+		loader=PrefetchedPairLoader(
+			imagedir=imagedir,
+			maskdir=maskdir,
+			pairlistfile=listname,
+			image_size=image_size,
+			batch_size=batch_size,
+			depth=depth,
+			concurrency=concurrency,
+			mask_suffix=mask_suffix),
+		num_workers=num_workers,
+		batch_size=batch_size,
+		shuffle=False
+	)
+
+def shard_pair_iterator(sharddir, image_size, listname, num_workers, batch_size, mask_suffix="_gt.png"):
+	return pair_iterator(
+		loader=ShardPairLoader(
+			sharddir=sharddir,
+			pairlistfile=listname,
+			image_size=image_size,
+			mask_suffix=mask_suffix),
 		num_workers=num_workers,
 		batch_size=batch_size,
 		shuffle=False
@@ -0,0 +1,115 @@
+""" makesplits - generate fixed test splits in the layout of data/fixedsplits
+
+Masks are expected to be named CLS_NAME.png (e.g. 1_2007_000032.png, as produced by
+organizepascal5i.py). Every line of a generated split is a (query, support) pair of mask names:
+```
+	1_2010_000802 1_2011_002091
+```
+Pairs are grouped by class, and each fold gets its own splitN_test.txt.
+
+Sampling is seeded per (seed, class), so the output depends only on the mask directory, the seed
+and the number of pairs, and not on the number of worker processes.
+
+Usage:
+```
+	python src/makesplits.py data/pascal5i/masks out/pascal5i --pairs 3000 --classes 20 --folds 4
+	python src/makesplits.py data/coco/masks out/coco20i --pairs 2500 --classes 80 --folds 4 --interleaved
+```
+"""
+import os
+import argparse
+from multiprocessing import Pool
+import numpy as np
+
+
+def index_masks(maskdir, ext=".png"):
+	""" group the mask names in maskdir by class with a single directory scan
+
+	Return Value:
+	-------------
+		dict (int -> ndarray[str]) of sorted mask names for each class index
+	"""
+	classes = {}
+	with os.scandir(maskdir) as it:
+		for entry in it:
+			if not entry.name.endswith(ext):
+				continue
+			stem = entry.name[:-len(ext)]
+			cls = stem.split("_", 1)[0]
+			if cls.isdigit():
+				classes.setdefault(int(cls), []).append(stem)
+	# scandir order is filesystem dependent
+	return {cls: np.array(sorted(stems)) for cls, stems in classes.items()}
+
+
+def fold_classes(fold, num_folds, num_classes, interleaved=False):
+	""" the 1-based test classes of a fold
+
+	PASCAL-5i uses contiguous blocks (fold 0 -> 1..5), COCO-20i interleaves them (fold 0 -> 1, 5, 9, ...).
+	"""
+	if interleaved:
+		return list(range(fold + 1, num_classes + 1, num_folds))
+	per_fold = num_classes // num_folds
+	return list(range(fold * per_fold + 1, (fold + 1) * per_fold + 1))
+
+
+def sample_pairs(stems, num_pairs, seed, cls):
+	""" sample num_pairs (query, support) pairs from stems with query != support
+
+	Return Value:
+	-------------
+		the pairs, one "query support" string per pair
+	"""
+	n = len(stems)
+	if n < 2:
+		raise ValueError(f"class {cls} has {n} mask(s), at least 2 are needed")
+	rng = np.random.default_rng([seed, cls])
+	q = rng.integers(0, n, size=num_pairs)
+	# draw from the n-1 other masks and skip over the query
+	s = rng.integers(0, n - 1, size=num_pairs)
+	s += (s >= q)
+	return np.char.add(np.char.add(stems[q], " "), stems[s])
+
+
+def _sample_class(args):
+	return sample_pairs(*args)
+
+
+def write_split(path, pairs):
+	with open(path, "w") as f:
+		f.write("\n".join(pairs))
+		f.write("\n")
+
+
+def make_splits(maskdir, outdir, num_pairs, num_classes, num_folds, seed=0, interleaved=False, workers=1):
+	index = index_masks(maskdir)
+	if not os.path.isdir(outdir):
+		os.makedirs(outdir)
+	for fold in range(num_folds):
+		classes = fold_classes(fold, num_folds, num_classes, interleaved)
+		missing = [cls for cls in classes if cls not in index]
+		if missing:
+			raise ValueError(f"no masks found for classes {missing}")
+		jobs = [(index[cls], num_pairs, seed, cls) for cls in classes]
+		if workers > 1:
+			with Pool(workers) as pool:
+				pairs = pool.map(_sample_class, jobs)
+		else:
+			pairs = list(map(_sample_class, jobs))
+		write_split(os.path.join(outdir, f"split{fold}_test.txt"), np.concatenate(pairs))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="generate fixed (query, support) test splits")
+	parser.add_argument("maskdir", help="directory of CLS_NAME.png masks")
+	parser.add_argument("outdir", help="where the splitN_test.txt files are written")
+	parser.add_argument("--pairs", type=int, default=3000, help="pairs per class")
+	parser.add_argument("--classes", type=int, default=20, help="total number of classes")
+	parser.add_argument("--folds", type=int, default=4, help="number of folds")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--interleaved", action="store_true", help="COCO-20i style fold assignment")
+	parser.add_argument("--workers", type=int, default=1)
+	args = parser.parse_args()
+
+	make_splits(args.maskdir, args.outdir, args.pairs, args.classes, args.folds,
+		seed=args.seed, interleaved=args.interleaved, workers=args.workers)
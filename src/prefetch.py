@@ -0,0 +1,209 @@
+""" prefetch - asyncio read-ahead for image stores with high per-file latency
+
+On a network filesystem most of the time spent loading a pair goes into waiting on open() and read()
+for its four files. The AsyncPrefetcher knows the order in which pairs will be requested and keeps
+the raw bytes of the next `depth` pairs in memory, issuing up to `concurrency` reads at a time from
+an event loop running in a background thread. Consumers only decode.
+
+Example:
+--------
+```
+	prefetcher = AsyncPrefetcher(paths_for=lambda i: fsindex[i][:4], order=range(len(fsindex)), depth=64)
+	for i in range(len(fsindex)):
+		qimage, qmask, simage, smask = prefetcher.get(i)    # bytes (None for aug/null masks)
+	prefetcher.close()
+```
+
+The latency argument adds an artificial delay to every read, which makes it possible to measure the
+effect of the prefetcher against a local directory (see __main__).
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_bytes(path):
+	""" the contents of path; None for the aug/null masks, which have no file (see read_mask) """
+	if path.find("aug/null") != -1:
+		return None
+	with open(path, "rb") as f:
+		return f.read()
+
+
+def worker_order(length, batch_size, worker_id, num_workers):
+	""" the indices that a DataLoader worker is handed for an unshuffled dataset
+
+	With shuffle=False the batches are dealt round-robin to the workers, so worker w loads
+	batches w, w + num_workers, w + 2 * num_workers, ...
+	"""
+	return [i for i in range(length) if (i // batch_size) % num_workers == worker_id]
+
+
+class AsyncPrefetcher:
+	""" reads the files of upcoming items ahead of time into an in-memory buffer pool
+
+		Attributes
+		-----------
+		paths_for : callable (int -> [str])
+			the file paths that make up an item
+		order : [int]
+			the order in which items are going to be requested
+		depth : int
+			maximum number of items that are read ahead and held in memory
+		concurrency : int
+			maximum number of reads in flight
+		latency : float
+			artificial delay in seconds added to every read
+
+		Methods
+		-------
+		get(index)
+			the file contents for an item, waiting for them if they are still being read
+		close()
+			stop reading ahead and release the background thread
+	"""
+
+	def __init__(self, paths_for, order, depth=32, concurrency=16, latency=0.0):
+		self.paths_for = paths_for
+		self.order = list(order)
+		self.position = {index: pos for pos, index in enumerate(self.order)}
+		self.depth = depth
+		self.concurrency = concurrency
+		self.latency = latency
+
+		self._ready = {}
+		self._next = 0              # items before this position are no longer wanted
+		self._cond = threading.Condition()
+		self._closed = False
+		self._executor = ThreadPoolExecutor(max_workers=concurrency)
+		self._reads = asyncio.Semaphore(concurrency)
+		self._window = asyncio.Semaphore(depth)
+		self._loop = asyncio.new_event_loop()
+		self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+		self._thread.start()
+		self._task = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+	def _read_sync(self, path):
+		if self.latency > 0:
+			time.sleep(self.latency)
+		return read_bytes(path)
+
+	async def _read(self, path):
+		async with self._reads:
+			if self.latency > 0:
+				await asyncio.sleep(self.latency)
+			return await self._loop.run_in_executor(self._executor, read_bytes, path)
+
+	async def _fetch(self, pos, index):
+		try:
+			bufs = await asyncio.gather(*[self._read(p) for p in self.paths_for(index)])
+		except Exception as e:
+			bufs = e
+		with self._cond:
+			if pos < self._next:
+				# skipped or already read directly by get()
+				self._window.release()
+				return
+			self._ready[pos] = bufs
+			self._cond.notify_all()
+
+	async def _run(self):
+		for pos, index in enumerate(self.order):
+			await self._window.acquire()
+			if self._closed:
+				return
+			with self._cond:
+				if pos < self._next:
+					self._window.release()
+					continue
+			self._loop.create_task(self._fetch(pos, index))
+
+	async def _shutdown(self):
+		# let the pending reads unwind before the loop stops
+		tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		self._loop.stop()
+
+	def _release(self, count):
+		for _ in range(count):
+			self._loop.call_soon_threadsafe(self._window.release)
+
+	def get(self, index):
+		""" the file contents for the item at index, in the order given by paths_for
+
+		Items requested out of order are read directly; any items that were skipped over are
+		dropped from the buffer pool.
+		"""
+		pos = self.position.get(index)
+		with self._cond:
+			if pos is None or pos < self._next or self._closed:
+				pos = None
+		if pos is None:
+			return [self._read_sync(p) for p in self.paths_for(index)]
+
+		with self._cond:
+			skipped = [p for p in self._ready if p < pos]
+			for p in skipped:
+				del self._ready[p]
+			self._next = pos
+			# free the skipped slots first, otherwise _run cannot get as far as pos
+			self._release(len(skipped))
+			self._cond.wait_for(lambda: pos in self._ready or self._closed)
+			bufs = self._ready.pop(pos, None)
+			self._next = pos + 1
+		if bufs is not None:
+			self._release(1)
+
+		if bufs is None:
+			return [self._read_sync(p) for p in self.paths_for(index)]
+		if isinstance(bufs, Exception):
+			raise bufs
+		return bufs
+
+	def close(self):
+		with self._cond:
+			self._closed = True
+			self._cond.notify_all()
+		asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+		self._thread.join()
+		self._loop.close()
+		self._executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+	# compare sequential reads against the prefetcher on a local directory with injected latency
+	if len(sys.argv) < 2:
+		print("Usage: python prefetch.py directory [latency-seconds]")
+		sys.exit(1)
+	directory = sys.argv[1]
+	latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+	files = sorted(os.path.join(directory, f) for f in os.listdir(directory))[:400]
+	items = [files[i:i + 4] for i in range(0, len(files) - 3, 4)]
+
+	start = time.time()
+	for paths in items:
+		for p in paths:
+			time.sleep(latency)
+			read_bytes(p)
+	print(f"sequential: {time.time() - start:.2f}s for {len(items)} items")
+
+	start = time.time()
+	prefetcher = AsyncPrefetcher(paths_for=lambda i: items[i], order=range(len(items)), depth=32, concurrency=32, latency=latency)
+	for i in range(len(items)):
+		prefetcher.get(i)
+	prefetcher.close()
+	print(f"prefetched: {time.time() - start:.2f}s for {len(items)} items")
+
+	# jumping further ahead than depth must not stall the read-ahead
+	prefetcher = AsyncPrefetcher(paths_for=lambda i: items[i], order=range(len(items)), depth=2, concurrency=4)
+	while len(prefetcher._ready) < 2:
+		time.sleep(0.01)
+	assert prefetcher.get(5) == [read_bytes(p) for p in items[5]]
+	assert prefetcher.get(1) == [read_bytes(p) for p in items[1]]
+	prefetcher.close()
+	print("skip-ahead access ok")
@@ -0,0 +1,174 @@
+""" shards - pack the benchmark images and masks into a few large shard files
+
+The images and masks referenced by the TOSS split files are copied, byte for byte, into
+shard-NNNNN.bin files of up to `shard_size` bytes each, in the order in which they first appear
+in the split files. index.json maps every packed file to its (shard, offset, length). Keys are
+the paths relative to the dataset root, e.g. images/2007_000032.jpg and masks/1_2007_000032.png,
+so a loader built with imagedir="images" and maskdir="masks" resolves the same keys.
+
+Staging the benchmark on an evaluation node then comes down to copying a handful of large files.
+
+The generalization tier uses the FSS-1000 naming and its own image and mask directories, so it is
+packed into a separate shard directory with --fss1000.
+
+Usage:
+```
+	python src/shards.py data/pascal5i/images data/pascal5i/masks out/shards data/tiers/attribute/*.txt
+	python src/shards.py data/fss1k/images data/fss1k/masks out/shards-general data/tiers/general/general_tier.txt --fss1000
+```
+"""
+import os
+import json
+import argparse
+import mmap
+
+
+INDEX_FILE = "index.json"
+
+
+def declass(filename):
+	# same as loader_tier2.declass, kept here so packing does not need torch
+	if filename.find("aug") != -1:
+		return "_".join(filename.split("_")[2:])
+	return "_".join(filename.split("_")[1:])
+
+
+def split_items(listfiles):
+	""" the query and support names of every pair in listfiles, in order, without duplicates """
+	seen = set()
+	for listfile in listfiles:
+		with open(listfile, "r") as f:
+			for line in f:
+				for item in line.split()[:2]:
+					if item not in seen:
+						seen.add(item)
+						yield item
+
+
+def item_files(item, fss1000=False):
+	""" image name and candidate mask names of a query or support item, as the loaders resolve them
+
+	PASCAL-5i items (1_2007_000032) have masks named after the item itself, NAME.png for the attribute
+	tier and NAME_gt.png for the support cognizance tier. FSS-1000 items (642_sundial_9) drop the
+	leading class number for both files, as in loader_fss1000.
+	"""
+	if fss1000:
+		stem = item.split("_", 1)[1]
+		return stem + ".jpg", [stem + ".png"]
+	return declass(item) + ".jpg", [item + ".png", item + "_gt.png"]
+
+
+def split_keys(imagedir, maskdir, listfiles, fss1000=False):
+	""" (key, path) of every existing image and mask referenced by listfiles
+
+	Masks are packed under every candidate name that exists. An image, or a mask with none of its
+	candidate names on disk, counts as one missing file.
+	"""
+	missing = 0
+	for item in split_items(listfiles):
+		image, masks = item_files(item, fss1000)
+		path = os.path.join(imagedir, image)
+		if os.path.isfile(path):
+			yield "images/" + image, path
+		else:
+			missing += 1
+		# aug/null masks are all-zero and have no file
+		if item.find("aug/null") != -1:
+			continue
+		found = False
+		for mask in masks:
+			path = os.path.join(maskdir, mask)
+			if os.path.isfile(path):
+				found = True
+				yield "masks/" + mask, path
+		missing += not found
+	if missing:
+		print(f"{missing} referenced files are missing on disk")
+
+
+def pack(imagedir, maskdir, outdir, listfiles, shard_size=1 << 30, fss1000=False):
+	""" copy every file referenced by listfiles into shards under outdir and write the index """
+	if not os.path.isdir(outdir):
+		os.makedirs(outdir)
+	index = {}
+	shard, offset, out = -1, 0, None
+	for key, path in split_keys(imagedir, maskdir, listfiles, fss1000):
+		if key in index:
+			continue
+		with open(path, "rb") as f:
+			data = f.read()
+		if out is None or (offset > 0 and offset + len(data) > shard_size):
+			if out is not None:
+				out.close()
+			shard, offset = shard + 1, 0
+			out = open(os.path.join(outdir, f"shard-{shard:05d}.bin"), "wb")
+		out.write(data)
+		index[key] = (shard, offset, len(data))
+		offset += len(data)
+	if out is not None:
+		out.close()
+	with open(os.path.join(outdir, INDEX_FILE), "w") as f:
+		json.dump({"shards": shard + 1, "files": index}, f)
+	return index
+
+
+class ShardStore:
+	""" read-only access to the files packed by pack()
+
+		Attributes
+		-----------
+		directory : str
+			the directory with index.json and the shard files
+		index : dict (str -> (int, int, int))
+			(shard, offset, length) of every packed file
+
+		Methods
+		-------
+		read(key)
+			the contents of a packed file; raises KeyError if it was not packed
+	"""
+	def __init__(self, directory):
+		self.directory = directory
+		with open(os.path.join(directory, INDEX_FILE), "r") as f:
+			meta = json.load(f)
+		self.num_shards = meta["shards"]
+		self.index = meta["files"]
+		self._maps = None
+
+	def __getstate__(self):
+		# memory maps are opened again in every worker process
+		state = self.__dict__.copy()
+		state["_maps"] = None
+		return state
+
+	def _open(self):
+		self._maps = []
+		for shard in range(self.num_shards):
+			with open(os.path.join(self.directory, f"shard-{shard:05d}.bin"), "rb") as f:
+				self._maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+	def read(self, key):
+		shard, offset, length = self.index[key]
+		if self._maps is None:
+			self._open()
+		return self._maps[shard][offset:offset + length]
+
+	def __contains__(self, key):
+		return key in self.index
+
+	def __len__(self):
+		return len(self.index)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="pack the files referenced by split files into shards")
+	parser.add_argument("imagedir")
+	parser.add_argument("maskdir")
+	parser.add_argument("outdir")
+	parser.add_argument("splitfiles", nargs="+")
+	parser.add_argument("--fss1000", action="store_true", help="the split files are from the generalization tier")
+	parser.add_argument("--shard-size", type=int, default=1 << 30, help="maximum bytes per shard")
+	args = parser.parse_args()
+
+	index = pack(args.imagedir, args.maskdir, args.outdir, args.splitfiles, shard_size=args.shard_size, fss1000=args.fss1000)
+	print(f"packed {len(index)} files")
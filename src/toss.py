@@ -0,0 +1,263 @@
+""" toss - command line entry point for running the TOSS benchmark
+
+Subcommands:
+```
+	python src/toss.py setup pascal5i path-to-voc-download [--cleanup]
+	python src/toss.py setup fss1000 path-to-the-fss1000-dataset
+	python src/toss.py verify
+	python src/toss.py evaluate
+	python src/toss.py score-from-cache
+```
+All tiers and folds are described by a single JSON config (toss.json by default, see the one at the
+top of the repository). The model is given as "module:function"; the function is called with the
+config and returns a callable predict(support_images, support_masks, query_images) -> logits[b,2,h,w].
+
+evaluate writes the intersection and union of every prediction to a CSV per tier, fold and partition
+under the cache directory. score-from-cache computes the tier scores from those files only.
+
+Only the standard library is imported up front; torch and the loaders are imported by evaluate, so
+verify and score-from-cache start without them.
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+import importlib
+import subprocess
+
+from filescores2ics import TestSetQCS
+from shards import declass
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+
+# partitions of the attribute tier and their TestSetQCS part types
+PARTS = [
+	("easy_sal", TestSetQCS.PartType_EasySalient),
+	("easy_nsal", TestSetQCS.PartType_EasyNonSalient),
+	("hard_sal", TestSetQCS.PartType_HardSalient),
+	("hard_nsal", TestSetQCS.PartType_HardNonSalient),
+]
+
+CACHE_FIELDS = ["classidx", "weight_idx", "intersection", "union"]
+
+
+def load_config(path):
+	with open(path, "r") as f:
+		return json.load(f)
+
+
+def runs(config, tiers=None, folds=None):
+	""" (tier, fold, part, listfile) for every test list in the config
+
+	fold and part are None where the tier has no folds or partitions.
+	"""
+	folds = config["folds"] if folds is None else folds
+	for tier, spec in config["tiers"].items():
+		if tiers is not None and tier not in tiers:
+			continue
+		if tier == "general":
+			yield tier, None, None, spec["list"]
+		elif tier == "attribute":
+			for fold in folds:
+				for part, _ in PARTS:
+					yield tier, fold, part, spec["list"].format(fold=fold, part=part)
+		else:
+			for fold in folds:
+				yield tier, fold, None, spec["list"].format(fold=fold)
+
+
+def cache_path(config, tier, fold, part):
+	name = tier
+	if fold is not None:
+		name += f"_split{fold}"
+	if part is not None:
+		name += f"_{part}"
+	return os.path.join(config["cache"], name + ".csv")
+
+
+def item_paths(tier, spec, item):
+	""" image and mask path of a query or support item, as resolved by the tier's loader """
+	if tier == "general":
+		stem = item.split("_", 1)[1]
+		return os.path.join(spec["images"], stem + ".jpg"), os.path.join(spec["masks"], stem + ".png")
+	image = os.path.join(spec["images"], declass(item) + ".jpg")
+	mask = os.path.join(spec["masks"], item + spec.get("mask_suffix", "_gt.png"))
+	return image, mask
+
+
+############################################################## Subcommands ############################################################
+def setup(args):
+	if args.dataset == "pascal5i":
+		cmd = [sys.executable, os.path.join(SRC, "organizepascal5i.py"), args.path] + (["cleanup"] if args.cleanup else [])
+	else:
+		cmd = [sys.executable, os.path.join(SRC, "organizefss1000.py"), args.path]
+	return subprocess.call(cmd)
+
+
+def verify(args):
+	config = load_config(args.config)
+	bad = 0
+	# the lists share most of their items, so the files of every item are checked only once
+	checked = {}
+	for tier, fold, part, listfile in runs(config, args.tiers, args.folds):
+		spec = config["tiers"][tier]
+		if not os.path.isfile(listfile):
+			print(f"missing list {listfile}")
+			bad += 1
+			continue
+		if tier == "general" and not os.path.isfile(spec["classes"]):
+			print(f"missing class list {spec['classes']}")
+			bad += 1
+		missing = set()
+		with open(listfile, "r") as f:
+			for line in f:
+				for item in line.split()[:2]:
+					key = (tier, item)
+					if key not in checked:
+						# aug/null masks are all-zero and have no file
+						checked[key] = [path for path in item_paths(tier, spec, item)
+							if path.find("aug/null") == -1 and not os.path.isfile(path)]
+					missing.update(checked[key])
+		if missing:
+			print(f"{listfile}: {len(missing)} missing files, e.g. {sorted(missing)[0]}")
+			bad += 1
+	if bad:
+		print("missing files")
+		return 1
+	print("all verified")
+	return 0
+
+
+def load_model(config):
+	module, function = config["model"].split(":")
+	sys.path.insert(0, os.getcwd())
+	return getattr(importlib.import_module(module), function)(config)
+
+
+def evaluate(args):
+	import torch
+	from loader_tier2 import fixed_pair_iterator
+	from loader_fss1000 import general_pair_iterator
+
+	config = load_config(args.config)
+	device = torch.device(config.get("device", "cuda") if torch.cuda.is_available() else "cpu")
+	predict = load_model(config)
+	if not os.path.isdir(config["cache"]):
+		os.makedirs(config["cache"])
+
+	for tier, fold, part, listfile in runs(config, args.tiers, args.folds):
+		spec = config["tiers"][tier]
+		if tier == "general":
+			iterator = general_pair_iterator(
+				spec["images"], spec["masks"], config["image_size"], listfile, spec["classes"],
+				config["num_workers"], config["batch_size"])
+		else:
+			iterator = fixed_pair_iterator(
+				spec["images"], spec["masks"], config["image_size"], listfile,
+				config["num_workers"], config["batch_size"], mask_suffix=spec.get("mask_suffix", "_gt.png"))
+
+		print(f"evaluating {listfile}")
+		with open(cache_path(config, tier, fold, part), "w", newline="") as f:
+			writer = csv.writer(f)
+			writer.writerow(CACHE_FIELDS)
+			for batch in iterator:
+				simage, smask, qimage, qmask, classidx = batch[:5]
+				with torch.no_grad():
+					logits = predict(simage.to(device), smask.to(device), qimage.to(device))
+				output = torch.argmax(logits, dim=1).cpu() == 1
+				label = qmask[:, 0] == 1
+				intersection = (output & label).sum(dim=(1, 2))
+				union = (output | label).sum(dim=(1, 2))
+				if tier == "suppcog":
+					weight, scoretype = batch[5], batch[6]
+					weight_idx = [int(w) if st > 0 else -1 for w, st in zip(weight.tolist(), scoretype.tolist())]
+				else:
+					weight_idx = [0] * len(classidx)
+				writer.writerows(zip(classidx.tolist(), weight_idx, intersection.tolist(), union.tolist()))
+
+	return score(args)
+
+
+def read_cache(path):
+	""" summed (intersection, union) for each (classidx, weight_idx) in a cache file
+
+	The metrics only keep per-class sums, so they can be fed the totals instead of every row.
+	"""
+	totals = {}
+	with open(path, "r", newline="") as f:
+		reader = csv.reader(f)
+		next(reader)
+		for classidx, weight_idx, i, u in reader:
+			key = (int(classidx), int(weight_idx))
+			if key not in totals:
+				totals[key] = [0, 0]
+			totals[key][0] += int(i)
+			totals[key][1] += int(u)
+	return totals
+
+
+def score(args):
+	from filescores2gs import ClasswiseMetrics
+	from filescores2scs import SCSScore
+
+	config = load_config(args.config)
+	qcs = {}
+	for tier, fold, part, _ in runs(config, args.tiers, args.folds):
+		path = cache_path(config, tier, fold, part)
+		if not os.path.isfile(path):
+			print(f"no cached results in {path}")
+			continue
+
+		if tier == "suppcog":
+			scs = SCSScore(class_list=list(range(5 * fold + 1, 5 * fold + 6)))
+			for (classidx, weight_idx), (i, u) in read_cache(path).items():
+				scs.update_counts(classidx, weight_idx, i, u)
+			print(f"suppcog  fold {fold}: SCS {scs.meanIoU():.4f}")
+			continue
+
+		cm = ClasswiseMetrics()
+		for (classidx, _), (i, u) in read_cache(path).items():
+			cm.update_counts(classidx, i, u)
+		if tier == "general":
+			print(f"general: mean-IoU {cm.meanIoU():.4f}")
+		else:
+			if fold not in qcs:
+				qcs[fold] = TestSetQCS()
+			qcs[fold].update(fold_number=fold, part_type=dict(PARTS)[part], mean_iou=cm.meanIoU())
+
+	for fold, tsq in sorted(qcs.items()):
+		print(f"attribute fold {fold}: LCA {tsq.fold_lca(fold):.4f} HCA {tsq.fold_hca(fold):.4f}")
+	if qcs:
+		lca = sum(tsq.fold_lca(fold) for fold, tsq in qcs.items()) / len(qcs)
+		hca = sum(tsq.fold_hca(fold) for fold, tsq in qcs.items()) / len(qcs)
+		print(f"attribute mean over {len(qcs)} folds: LCA {lca:.4f} HCA {hca:.4f}")
+	return 0
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog="toss", description="run the TOSS benchmark")
+	sub = parser.add_subparsers(dest="command", required=True)
+
+	p = sub.add_parser("setup", help="organize a downloaded dataset into the layout used by the loaders")
+	p.add_argument("dataset", choices=["pascal5i", "fss1000"])
+	p.add_argument("path")
+	p.add_argument("--cleanup", action="store_true", help="remove the VOC download after organizing (pascal5i)")
+	p.set_defaults(func=setup)
+
+	for name, func, text in [
+			("verify", verify, "check that every file referenced by the configured tiers exists"),
+			("evaluate", evaluate, "run the model over the configured tiers and folds and cache the results"),
+			("score-from-cache", score, "compute the tier scores from cached results")]:
+		p = sub.add_parser(name, help=text)
+		p.add_argument("--config", default="toss.json")
+		p.add_argument("--tiers", nargs="+", default=None, help="subset of the configured tiers")
+		p.add_argument("--folds", nargs="+", type=int, default=None, help="subset of the configured folds")
+		p.set_defaults(func=func)
+
+	args = parser.parse_args(argv)
+	return args.func(args)
+
+
+if __name__ == "__main__":
+	sys.exit(main())